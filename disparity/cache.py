@@ -0,0 +1,217 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+# caches of this process, flushed when it exits
+_caches = weakref.WeakSet()
+
+
+@atexit.register
+def flush_all():
+    """
+    Writes the pending values of every cache of this process when it exits. Pool workers end with os._exit, which skips
+    atexit hooks, so pools that compute EMDs flush the cache of their instance at the end of every task instead.
+    """
+    for cache in list(_caches):
+        cache.flush()
+
+
+class EMDCache:
+    def __init__(self, path, max_entries=1000000, memory_entries=100000, flush_every=256, flush_interval=1.0,
+                 mmap_size=256 * 1024 * 1024, shared=False):
+        """
+        Initializes an EMDCache, a persistent cache of EMD values keyed by the content of the compared histograms. It is
+        an SQLite database, memory-mapped for reads, that pool processes and concurrent runs can read and write at the
+        same time. By default it is in WAL mode, which lets readers and a writer work concurrently but relies on
+        shared memory, so all of them must run on the same host. With shared, it uses a rollback journal instead,
+        which only relies on file locks and can be used from several machines sharing a filesystem whose locks work
+        (see https://www.sqlite.org/useovernet.html); writers then lock the whole database and wait for each other.
+        Values found or computed in a process are also kept in memory. New values and access times are written in
+        batches; entries of a process that is killed before its last batch is written are simply lost.
+        :param path: string, path of the database file.
+        :param max_entries: int, number of entries kept on disk. The least recently used ones are evicted.
+        :param memory_entries: int, number of entries kept in memory by every process.
+        :param flush_every: int, number of pending writes after which they are written to disk.
+        :param flush_interval: float, seconds after which pending writes are written to disk.
+        :param mmap_size: int, number of bytes of the database that are memory-mapped.
+        :param shared: bool, if true the database uses a rollback journal, so that it can be shared across machines.
+        """
+        assert max_entries > 0, "max_entries must be a positive integer"
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.mmap_size = mmap_size
+        self.shared = shared
+        self.__memory = OrderedDict()
+        self.__reset()
+        _caches.add(self)
+
+    def __reset(self):
+        self.__pid = None
+        self.__connection = None
+        self.__pending = {}
+        self.__touched = set()
+        self.__last_flush = time.time()
+        self.hits = self.misses = 0
+        self.__flushed_hits = self.__flushed_misses = 0
+
+    def __getstate__(self):
+        # connections can not be shared with other processes, the cache reconnects wherever it is unpickled
+        state = dict(self.__dict__)
+        state['_EMDCache__connection'] = None
+        state['_EMDCache__pid'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        _caches.add(self)
+
+    def __check_fork(self):
+        # forked processes must open their own connection, and start from empty counters and batches
+        if self.__pid is not None and self.__pid != os.getpid():
+            self.__reset()
+
+    @property
+    def connection(self):
+        self.__check_fork()
+        if self.__connection is None:
+            self.__pid = os.getpid()
+            self.__connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self.__connection.execute('PRAGMA journal_mode=' + ('DELETE' if self.shared else 'WAL'))
+            self.__connection.execute('PRAGMA synchronous=' + ('FULL' if self.shared else 'NORMAL'))
+            self.__connection.execute('PRAGMA mmap_size=' + str(int(self.mmap_size)))
+            self.__connection.execute('CREATE TABLE IF NOT EXISTS emd '
+                                      '(key BLOB PRIMARY KEY, value REAL NOT NULL, accessed REAL NOT NULL)')
+            self.__connection.execute('CREATE INDEX IF NOT EXISTS emd_accessed ON emd (accessed)')
+            self.__connection.execute('CREATE TABLE IF NOT EXISTS stats '
+                                      '(name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        return self.__connection
+
+    @staticmethod
+    def key(first, second, bins, normalize, symmetric=True):
+        """
+        Content address of the EMD between two histograms (or two arrays of values, when bins is auto).
+        :param first: numpy array
+        :param second: numpy array
+        :param bins: string or numpy array, bin edges or auto.
+        :param normalize: bool
+        :param symmetric: bool, if true the key does not depend on the order of first and second.
+        :return: bytes
+        """
+        digests = [hashlib.sha1(np.ascontiguousarray(a, dtype=np.float64).tobytes()).digest() for a in (first, second)]
+        if symmetric:
+            digests.sort()
+        bins = bins.encode() if isinstance(bins, str) else np.asarray(bins, dtype=np.float64).tobytes()
+        return hashlib.sha1(digests[0] + digests[1] + bins + (b'1' if normalize else b'0')).digest()
+
+    def get(self, key):
+        """
+        Looks up a value, in memory first and then on disk.
+        :param key: bytes
+        :return: float, or None if the value is not cached
+        """
+        self.__check_fork()
+        value = self.__memory.get(key)
+        if value is None:
+            value = self.__pending.get(key)
+        if value is None:
+            row = self.connection.execute('SELECT value FROM emd WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                value = row[0]
+                self.__remember(key, value)
+        elif key in self.__memory:
+            self.__memory.move_to_end(key)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.__touched.add(key)
+        return value
+
+    def set(self, key, value):
+        """
+        Stores a value. It is written to disk with the next batch.
+        :param key: bytes
+        :param value: float
+        """
+        self.__check_fork()
+        self.__remember(key, value)
+        self.__pending[key] = value
+        if len(self.__pending) >= self.flush_every or time.time() - self.__last_flush >= self.flush_interval:
+            self.flush()
+
+    def __remember(self, key, value):
+        self.__memory[key] = value
+        if len(self.__memory) > self.memory_entries:
+            self.__memory.popitem(last=False)
+
+    def flush(self):
+        """
+        Writes pending values, access times and hit counters to disk, and evicts the least recently used entries
+        beyond max_entries.
+        """
+        self.__check_fork()
+        self.__last_flush = time.time()
+        if not (self.__pending or self.__touched or self.hits != self.__flushed_hits or
+                self.misses != self.__flushed_misses):
+            return
+        connection = self.connection
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany('INSERT OR REPLACE INTO emd (key, value, accessed) VALUES (?, ?, ?)',
+                                   [(key, value, now) for key, value in self.__pending.items()])
+            connection.executemany('UPDATE emd SET accessed = ? WHERE key = ?',
+                                   [(now, key) for key in self.__touched if key not in self.__pending])
+            for name, value in (('hits', self.hits - self.__flushed_hits),
+                                ('misses', self.misses - self.__flushed_misses)):
+                connection.execute('INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)', (name,))
+                connection.execute('UPDATE stats SET value = value + ? WHERE name = ?', (value, name))
+            excess = connection.execute('SELECT COUNT(*) FROM emd').fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute('DELETE FROM emd WHERE key IN (SELECT key FROM emd ORDER BY accessed LIMIT ?)',
+                                   (excess,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self.__pending = {}
+        self.__touched = set()
+        self.__flushed_hits, self.__flushed_misses = self.hits, self.misses
+
+    def stats(self):
+        """
+        Returns the hit-rate statistics of this process, and those of all the processes that used the database.
+        :return: dict
+        """
+        self.flush()
+        totals = dict(self.connection.execute('SELECT name, value FROM stats').fetchall())
+        total_hits, total_misses = totals.get('hits', 0), totals.get('misses', 0)
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / (self.hits + self.misses) if self.hits + self.misses else 0,
+            'total_hits': total_hits,
+            'total_misses': total_misses,
+            'total_hit_rate': total_hits / (total_hits + total_misses) if total_hits + total_misses else 0,
+            'entries': self.connection.execute('SELECT COUNT(*) FROM emd').fetchone()[0]
+        }
+
+    def close(self):
+        """
+        Writes pending values and closes the database.
+        """
+        self.flush()
+        if self.__connection is not None:
+            self.__connection.close()
+        self.__pid = None
+        self.__connection = None
@@ -0,0 +1,117 @@
+import argparse
+
+# Opaque Process
+percentages = {
+    10: 0.1,
+    30: 0.3,
+    50: 0.5,
+    # 'gender': 'g',
+    # 'gender_country': 'gc'
+}
+
+# Opaque Dataset
+K = {
+    50: [10],
+    500: [10],
+    7300: [10]
+}
+
+## movielens
+# F = {
+#     1: 1,
+#     2: 2,
+#     3: 3,
+# }
+
+
+def export_tables(name, content):
+    with open(name + '.txt', 'w') as w:
+        w.write(content)
+
+
+def run(bins, config, criterion, normalize, workers, metric='EMD', random_runs=1000, seed=None, processes=None,
+        cache=None, cache_size=1000000, shared_cache=False):
+    # Imported here so that `--help` does not pay for the computation backends.
+    from disparity import divergence
+    from disparity.emd import EMD
+    from disparity.helpers import Helper
+
+    db = "WorkerSet100K"
+    collection = 'workers'
+    ## simulated
+    F = {
+        1: [0.3, 0.7],
+        2: [0.7, 0.3],
+        3: [0.5, 0.5],
+        4: [1, 0],
+        5: [0, 1],
+        6: '6'
+    }
+    helper = Helper(configuration=config, N=workers, db_name=db, collection_name=collection)
+    workers = helper.get_documents()
+    attributes = helper.get_attributes(workers)
+    quantify_disparity_metric = EMD if metric == 'EMD' else getattr(divergence, metric)
+    if cache is not None:
+        from disparity.cache import EMDCache
+
+        cache = EMDCache(cache, max_entries=cache_size, shared=shared_cache)
+
+    name, values, time_values = helper.run_experiments(quantify_disparity_metric, workers, attributes, functions=F,
+                                                       percentages=percentages, bins=bins, criterion=criterion,
+                                                       normalize=normalize, random_runs=random_runs, seed=seed,
+                                                       processes=processes, cache=cache)
+
+    table, timetable = helper.build_tables(name, values, time_values, functions=F, percentages=percentages)
+    distributions = helper.build_distribution_table(functions=F, percentages=percentages)
+    export_tables(name, str(table) + '\n' + str(timetable) + '\n' + distributions)
+
+
+def main(argv=None):
+    """Main
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m disparity',
+                                     description='Run fairness experiment on the 100K simulated dataset.',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('-c', "--config", type=str, help='Experiments configuration.',
+                        choices=['transparent', 'opaque_process'], default='transparent')
+    parser.add_argument('-w', "--workers", type=int, help='Number of workers.', default=50)
+    parser.add_argument('-b', "--bins", type=str, help='If bins is auto and quantity is EMD, numpy will decide on '
+                                                       'the binning strategy for each partition. '
+                                                       'This will also be used to generate histograms of the function '
+                                                       'values per partition.',
+                        default='preset', choices=['auto', 'preset'])
+    parser.add_argument('-m', "--metric", type=str, help='Metric used to quantify disparity.', default='EMD',
+                        choices=['EMD', 'KL', 'JS', 'TV'])
+    parser.add_argument("--random-runs", type=int, help='Number of runs of the r-balanced and r-unbalanced '
+                                                            'baselines. Their mean, total time and distribution are '
+                                                            'reported.', default=1000)
+    parser.add_argument("--seed", type=int, help='Seed of the random baselines.', default=None)
+    parser.add_argument('-p', "--processes", type=int, help='Number of processes the random baselines are spread '
+                                                            'over.', default=None)
+    parser.add_argument("--cache", type=str, help='Path of a persistent cache of EMD values, shared by concurrent '
+                                                  'processes of the same host and reused by later runs. Only used '
+                                                  'with the EMD metric.', default=None)
+    parser.add_argument("--cache-size", type=int, help='Number of EMD values kept in the cache, the least recently '
+                                                       'used ones are evicted.', default=1000000)
+    parser.add_argument("--shared-cache", action='store_true', help='Use a cache database that can be shared by '
+                                                                    'several machines through a network filesystem, '
+                                                                    'at the cost of slower concurrent writes.')
+
+    emd_group = parser.add_argument_group('EMD specific arguments.')
+    emd_group.add_argument('-n', '--normalize', type=lambda x: (str(x).lower() == 'true'),
+                           help='Indicates whether per partition values should be normalized when using EMD.',
+                           default=True)
+    emd_group.add_argument('-r', "--criterion", type=str, help='Criterion to be used when ', default='avg',
+                           choices=['min', 'max', 'avg'])
+
+    args = parser.parse_args(argv)  # parse arguments from command line
+    if args.cache is not None and args.metric != 'EMD':
+        parser.error('--cache only stores EMD values, it can not be used with -m ' + args.metric)
+    if args.random_runs < 1:
+        parser.error('--random-runs must be a positive integer, got ' + str(args.random_runs))
+
+    run(args.bins, args.config, args.criterion, args.normalize, args.workers, args.metric, args.random_runs, args.seed,
+        args.processes, args.cache, args.cache_size, args.shared_cache)
+    return 0
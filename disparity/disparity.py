@@ -1,30 +1,36 @@
 from abc import abstractmethod, ABCMeta
 import numpy as np
 import copy
+import random
 
-CONFIGURATIONS = ['transparent', 'opaque_dataset', 'opaque_process']
+from disparity.partition import PartitionNode, PartitionTree
+
+CONFIGURATIONS = ['transparent', 'opaque_dataset', 'opaque_process', 'ranking']
 
 
 class QuantifyingDisparity(metaclass=ABCMeta):
-    def __init__(self, workers, attributes, configuration="transparent", f=None, selected=0.1, bins="preset"):
+    def __init__(self, workers, attributes, configuration="transparent", f=None, selected=0.1, bins="preset",
+                 criterion='avg'):
         """
         Initializes a QuantifyingDisparity instance.
         :param workers: list, a list of workers dicts
         :param attributes: dict, attributes and their values. For example, {'Gender': ['Male', 'Female']}
-        :param configuration: string, can be one of [transparent, opaque_process, opaque_dataset].
+        :param configuration: string, can be one of [transparent, opaque_process, opaque_dataset, ranking]. With ranking,
+               every worker must carry the Exposure it received in ranked result lists (see disparity.ranking).
         :param f: list, scoring function parameters. For now, f is expected to have a length of 2.
         :param selected: float, must be between 0 and 1. Percentage of workers who are accepted. Used when configuration
                is opaque_process.
         ":param bins: string, can be one of [preset, auto]
+        :param criterion: string, must be one of [avg, max, min]. How the distances between partitions are aggregated.
         """
         assert configuration in CONFIGURATIONS, "configuration must be one of [transparent, opaque_process, " \
-                                                "opaque_dataset] "
+                                                "opaque_dataset, ranking] "
         self.configuration = configuration
 
         assert type(attributes) is dict, "attributes must be a dictionary"
         self.original_attributes = dict(attributes)
 
-        if configuration in ['transparent', 'opaque_dataset']:
+        if configuration in ['transparent', 'opaque_dataset', 'ranking']:
             pass
             # assert (type(f) is list and len(f) == 2) or type(f) is int, "f must be a list of length 2 or an integer"
         else:
@@ -46,6 +52,14 @@ class QuantifyingDisparity(metaclass=ABCMeta):
                 bins = [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
         self.bins = bins
 
+        assert criterion in ['avg', 'max', 'min'], "criteria must be one of [avg, max, min], was " + str(criterion) + " instead"
+        self.criterion = criterion
+
+        # per partition histograms, keyed by the positions of the workers that make up the partition
+        self._histograms = {}
+        self._bin_edges = None
+        self._positions = None
+
     def __str__(self):
         return str(self.__class__.__name__) + ' instance with the following parameters: \n' + \
                'Number of workers: ' + str(len(self.workers[0])) + '\n' + \
@@ -56,7 +70,8 @@ class QuantifyingDisparity(metaclass=ABCMeta):
     def __set_task_qualification(self, workers, f, selected):
         """
         Method that sets the task qualification decision of a certain worker. If the configuration is opaque_process,
-        the value will be either 0 or 1, else it would be the value of function f.
+        the value will be either 0 or 1, if it is ranking, it would be the exposure of the worker in the ranked result
+        lists, else it would be the value of function f.
         :param workers: list of workers objects
         :param selected: float that represents the percentage of workers who are qualified.
         :return: list of workers with 'Accepted' property appended to every one of them
@@ -88,6 +103,8 @@ class QuantifyingDisparity(metaclass=ABCMeta):
                             worker['Accepted'] = 0
                 else:
                     worker['Accepted'] = 0 if np.random.uniform() <= (1 - selected) else 1
+            elif self.configuration == "ranking":
+                worker['Accepted'] = worker['Exposure']
             else:
                 if type(f) is list:
                     worker['Accepted'] = worker["LanguageTest"] / 100 * f[0] + worker["ApprovalRate"] / 100 * \
@@ -127,57 +144,416 @@ class QuantifyingDisparity(metaclass=ABCMeta):
                     new_set.append(workers_with_attribute)
         return new_set
 
-    @abstractmethod
-    def metric(self, partitions):
+    @property
+    def bin_edges(self):
+        """
+        Bin edges shared by the histograms of all partitions. Preset bins are used as is, while auto bins are decided by
+        numpy once, using the function values of all workers.
+        :return: numpy array of bin edges
+        """
+        if self.bins != 'auto':
+            return np.asarray(self.bins, dtype=np.float64)
+        if self._bin_edges is None:
+            self._bin_edges = np.histogram_bin_edges(self.values(self.workers[0]), bins='auto')
+        return self._bin_edges
+
+    @staticmethod
+    def values(partition):
+        """
+        Returns the function values of the workers in a partition.
+        :param partition: list of workers
+        :return: numpy array of Accepted values
+        """
+        return np.fromiter((worker['Accepted'] for worker in partition), dtype=np.float64, count=len(partition))
+
+    def _indices(self, partition):
+        """
+        Returns the positions of the workers of a partition in the workers of this instance.
+        :param partition: list of workers
+        :return: numpy array of positions, -1 for workers that do not belong to this instance
+        """
+        if self._positions is None:
+            self._positions = {id(worker): i for i, worker in enumerate(self.workers[0])}
+        # the workers of the instance live as long as it does, so no other object can have the id of one of them
+        return np.fromiter((self._positions.get(id(worker), -1) for worker in partition), dtype=np.int64,
+                           count=len(partition))
+
+    def _partition_key(self, partition):
+        """
+        Identifies a partition by the positions of its workers. Partitions are rebuilt on every split, but they always
+        hold the same worker objects, so equal keys mean equal function values. Partitions holding workers of another
+        instance, or copies of them, have no key.
+        :return: bytes, or None
+        """
+        indices = self._indices(partition)
+        return None if np.any(indices < 0) else indices.tobytes()
+
+    def histogram(self, partition):
+        """
+        Returns the (unnormalized) histogram of the function values of a partition over bin_edges. Histograms of
+        partitions of the workers of this instance are cached, so a partition that is seen again (e.g. by another
+        criterion or another metric) is not recounted.
+        :param partition: list of workers
+        :return: numpy array of counts
+        """
+        return self.histograms([partition])[0]
+
+    def histograms(self, partitions):
         """
-        Calculates the disparity of a given set of partitions. The returned value is based upon the approach used.
+        Returns the histograms of a list of partitions. All partitions whose histogram is not cached yet are counted
+        together in a single pass over their workers.
         :param partitions: list of partitions
-        :return: disparity quantity
+        :return: list of numpy arrays of counts
+        """
+        keys = [self._partition_key(partition) for partition in partitions]
+        missing = {}
+        for i, (key, partition) in enumerate(zip(keys, partitions)):
+            if key is None:
+                # not cached, counted under a key of its own
+                missing[i] = partition
+            elif key not in self._histograms and key not in missing:
+                missing[key] = partition
+
+        counted = {}
+        if missing:
+            edges = self.bin_edges
+            n_bins = len(edges) - 1
+            values = np.concatenate([self.values(partition) for partition in missing.values()])
+            owners = np.repeat(np.arange(len(missing)), [len(partition) for partition in missing.values()])
+            # same binning as numpy.histogram: half-open bins, except for the last one which includes its right edge
+            indices = np.searchsorted(edges, values, side='right') - 1
+            indices[values == edges[-1]] = n_bins - 1
+            inside = (indices >= 0) & (indices < n_bins)
+            counts = np.bincount(owners[inside] * n_bins + indices[inside], minlength=len(missing) * n_bins)
+            counted = dict(zip(missing, counts.reshape(len(missing), n_bins).astype(np.float64)))
+            self._histograms.update((key, histogram) for key, histogram in counted.items() if isinstance(key, bytes))
+
+        return [self._histograms[key] if key is not None else counted[i] for i, key in enumerate(keys)]
+
+    def settings(self):
+        """
+        Settings that the disparity computed by this instance depends on, besides its workers. They are recorded in the
+        PartitionTree results, so that metric() only reuses the value of trees it computed itself.
+        :return: tuple
+        """
+        return self.__class__.__name__, self.configuration, self.bins if self.bins == 'auto' else tuple(self.bins), \
+            self.criterion
+
+    def configure(self):
+        """
+        Sets the settings specific to the metric of the instance. Subclasses that have some take them as arguments, with
+        defaults, so that copy_as can reset them.
+        """
+        pass
+
+    def copy_as(self, metric_class):
+        """
+        Returns a copy of this instance that quantifies disparity with another metric, with the default settings of
+        that metric. The copy only shares the state set by QuantifyingDisparity, e.g. the workers, so the partitions
+        found by this instance can be quantified by it, but not the histograms and bin edges.
+        :param metric_class: QuantifyingDisparity subclass
+        :return: metric_class instance
+        """
+        instance = metric_class.__new__(metric_class)
+        for name in ['configuration', 'original_attributes', 'workers', 'bins', 'criterion', '_positions']:
+            setattr(instance, name, getattr(self, name))
+        instance._histograms = {}
+        instance._bin_edges = None
+        instance.configure()
+        return instance
+
+    @abstractmethod
+    def distance(self, first_partition, second_partition):
+        """
+        Calculates the distance between two partitions, that the criterion aggregates.
+        :param first_partition: list of workers
+        :param second_partition: list of workers
+        :return: distance value
         """
         raise NotImplementedError
 
+    def metric(self, partitions, siblings=None):
+        """
+        Calculates the disparity of a given set of partitions. The returned value is based upon the approach used. The
+        value of a PartitionTree is reused if the tree was quantified by this instance (see PartitionTree.quantified_by),
+        and computed from its partitions otherwise.
+        :param partitions: list of partitions, or a PartitionTree
+        :param siblings: list of sibling partitions. If passed, the disparity is calculated between partitions and
+               their siblings.
+        :return: disparity quantity
+        """
+        if isinstance(partitions, PartitionTree):
+            if partitions.quantified_by(self):
+                return partitions.value
+            return self.metric(partitions.partitions())
+        if self.bins != 'auto':
+            # build the histograms of every partition involved in one batched pass
+            self.histograms(list(partitions) + list(siblings or []))
+        if self.criterion == 'avg':
+            return self.__avg(partitions, siblings)
+        elif self.criterion == 'min':
+            return self.__min(partitions, siblings)
+        else:
+            return self.__max(partitions, siblings)
+
+    def aggregate(self, contributions):
+        """
+        Combines the contributions of the partitions of a partitioning into the disparity of the partitioning.
+        :param contributions: list of the disparities between every partition and the other partitions
+        :return: disparity quantity
+        """
+        if self.criterion == 'avg':
+            return sum(contributions) / len(contributions) if contributions else 0
+        elif self.criterion == 'min':
+            return min(contributions, default=float('+inf'))
+        else:
+            return max(contributions, default=float('-inf'))
+
+    def contributions(self, partitions):
+        """
+        Calculates the disparity between every partition and the other partitions of the partitioning.
+        :param partitions: list of partitions
+        :return: list of disparity quantities, in the order of partitions
+        """
+        return [self.metric([p], partitions[:i] + partitions[i + 1:]) for i, p in enumerate(partitions)]
+
+    def partition_tree(self, partitions, paths):
+        """
+        Builds the PartitionTree of the partitions found by an algorithm.
+        :param partitions: list of partitions
+        :param paths: list of lists of the attributes every partition was split on, in order.
+        :return: PartitionTree
+        """
+        contributions = self.contributions(partitions)
+        leaves = []
+        for partition, path, histogram, contribution in zip(partitions, paths, self.histograms(partitions),
+                                                           contributions):
+            leaves.append(PartitionNode(tuple((a, partition[0][a]) for a in path), self._indices(partition), histogram,
+                                        contribution))
+        return PartitionTree(self.workers[0], leaves, self.aggregate(contributions), self.settings())
+
     def exhaustive(self):
         """
         Splits the workers on all attributes.
-        :return: list of partitions
+        :return: PartitionTree
         """
         workers = self.workers.copy()
         for i in self.original_attributes:
             workers = self.split(workers, i)
 
-        return workers
+        return self.partition_tree(workers, [list(self.original_attributes)] * len(workers))
 
-    @abstractmethod
     def balanced(self, random_attribute=False):
         """
-        Generates a partitioning of the workers in a greedy manner using the EMD of the worker partitions. It iteratively
+        Generates a partitioning of the workers in a greedy manner using the disparity of the worker partitions. It iteratively
         keeps trying to split the workers using the other attributes in the same manner and only stops whenever the
-        average EMD achieved by the current partitioning is greater than that of the next candidate partitioning.
-        :return: list of partitions of workers
+        disparity achieved by the current partitioning is greater than that of the next candidate partitioning.
+        :return: PartitionTree
         """
-        raise NotImplementedError
+        attributes = self.original_attributes.copy()
+        a = self.__worst_attribute(self.workers, attributes, random_attribute=random_attribute)
+        del attributes[a]
+        path = [a]
+        current = self.split(self.workers, a)
+        current_max = self.metric(current)
+
+        while len(attributes) > 0:
+            a = self.__worst_attribute(current, attributes, random_attribute=random_attribute)
+            del attributes[a]
+            children = self.split(current, a)
+            children_max = self.metric(children)
+            if current_max >= children_max:
+                break
+            else:
+                path.append(a)
+                current = children
+                current_max = children_max
+        return self.partition_tree(current, [path] * len(current))
+
+    def anytime(self, beam_width=1, time_budget=None, max_evaluations=None, processes=None):
+        """
+        Generates a balanced partitioning of the workers with an anytime beam search, which returns the best
+        partitioning found so far once its budget is exhausted. With beam_width 1 and no budget, it returns the same
+        partitioning as balanced.
+        :param beam_width: int, number of partitionings expanded at every level of the search.
+        :param time_budget: float, wall-clock seconds after which the search returns.
+        :param max_evaluations: int, number of candidate partitionings after which the search returns.
+        :param processes: int, number of processes evaluating the candidates in parallel.
+        :return: PartitionTree, with the quality-vs-time curve of the search in its trace attribute.
+        """
+        from disparity.search import beam_search
+
+        return beam_search(self, beam_width, time_budget, max_evaluations, processes)
 
     def random_balanced(self):
         """
         Runs the balanced algorithm but with the worst algorithm being selected randomly.
-        :return: list of partitions of workers
+        :return: PartitionTree
         """
         return self.balanced(random_attribute=True)
 
-    @abstractmethod
-    def unbalanced(self, random_attribute=False):
+    def unbalanced(self, random_attribute=False, time_budget=None, max_evaluations=None):
         """
         Generates a partitioning of the workers in a non-homogenous manner by locally deciding for each partition
         whether to further split it or not (i.e., resulting in a unbalanced partitioning tree). It decides whether
-        or not to split a given partition by comparing the average EMD of that partition with its siblings to that of
-        its children with its siblings.
-        :return: list of partitions of workers
+        or not to split a given partition by comparing the disparity of that partition with its siblings to that of
+        its children with its siblings. Once the budget is exhausted, partitions are no longer split.
+        :param time_budget: float, wall-clock seconds after which partitions are no longer split.
+        :param max_evaluations: int, number of split decisions after which partitions are no longer split.
+        :return: PartitionTree
         """
-        raise NotImplementedError
+        # imported here so that importing the metrics, e.g. in spawned workers, does not load multiprocessing and logging
+        from disparity.search import Budget
+
+        budget = Budget(time_budget, max_evaluations)
+        attributes = self.original_attributes.copy()
+        a = self.__worst_attribute(self.workers, attributes, random_attribute=random_attribute)
+
+        del attributes[a]
+        current = self.split(self.workers, a)
+        output = []
+
+        # used for retrieving the name of the
+        for i in current:
+            siblings = current.copy()
+            # Remove current partition from the list of partitions
+            siblings.remove(i)
+            partitions = self.__unbalanced_recursive([i], siblings, attributes, [a], budget,
+                                                     random_attribute=random_attribute)
+            for j in range(len(partitions)):
+                output.append(partitions[j])
+
+        return self.partition_tree([partition for partition, _ in output], [path for _, path in output])
+
+    def __unbalanced_recursive(self, current, siblings, A, path, budget, output=None, random_attribute=False):
+        """
+
+        :param current:
+        :param siblings:
+        :param A:
+        :param path: list of the attributes current was split on
+        :param budget: Budget, current is no longer split once it is exhausted
+        :param output:
+        :param random_attribute:
+        :return: list of (partition, path) tuples
+        """
+        if output is None:
+            output = []
+
+        attributes = A.copy()
+
+        if len(attributes) == 0 or budget.exhausted:
+            output.append((current[0], path))
+        else:
+            budget.spend()
+            current_max = self.metric(current, siblings)
+            a = self.__worst_attribute(current, attributes, random_attribute=random_attribute)
+            del attributes[a]
+            children = self.split(current, a)
+            children_max = self.metric(children, siblings)
+            if current_max >= children_max:
+                output.append((current[0], path))
+            else:
+                for i in children:
+                    siblings = children.copy()
+                    # Remove current partition from the list of partitions
+                    siblings.remove(i)
+                    self.__unbalanced_recursive([i], siblings, attributes, path + [a], budget,
+                                                output=output,
+                                                random_attribute=random_attribute)
+        return output
 
     def random_unbalanced(self):
         """
         Runs the unbalanced algorithm but with the worst algorithm being selected randomly.
-        :return:
+        :return: PartitionTree
         """
         return self.unbalanced(random_attribute=True)
+
+    def __worst_attribute(self, partition, attributes, random_attribute=False):
+        """
+        Finds the worst attribute in a given partition. The worst attribute is the one that when splitted on,
+        the resulting partitions exhibit the highest disparity. If random_attribute is true, returns a random
+        attribute as the worst.
+        :param partition:
+        :param attributes:
+        :param random_attribute:
+        :return:
+        """
+        if random_attribute:
+            return random.choice(list(attributes.keys()))
+        maximum = float('-inf')
+        worst = None
+        if len(attributes) > 0:
+            for a in attributes:
+                new_partitions = self.split(partition, a)
+                value = self.metric(new_partitions)
+                if maximum <= value:
+                    maximum = value
+                    worst = a
+        return worst
+
+    def __avg(self, partitions, siblings=None):
+        """
+        Finds the average distance between all partitions. If siblings is passed, it will find the average distance between
+        the supplied partitions and their siblings.
+        :param partitions: list of partitions
+        :param siblings: list of sibling partitions
+        :return: average distance
+        """
+        # in case of balanced, compare children with each other
+        if not siblings:
+            siblings = partitions
+        total = 0
+        count = 0
+
+        for p in partitions:
+            for q in siblings:
+                if p != q:
+                    distance = self.distance(p, q)
+                    total += distance
+                    count += 1
+        avg = total / count if count != 0 else 0
+        return avg
+
+    def __max(self, partitions, siblings=None):
+        """
+        Finds the maximum distance between partitions. If siblings is passed, it will find the maximum distance between
+        the supplied partitions and their siblings.
+        :param partitions: list of partitions
+        :param siblings: list of sibling partitions
+        :return: maximum distance
+        """
+        # in case of balanced, compare children with each other
+        if not siblings:
+            siblings = partitions
+        maximum = float('-inf')
+
+        for p in partitions:
+            for q in siblings:
+                if p != q:
+                    distance = self.distance(p, q)
+                    if distance >= maximum:
+                        maximum = distance
+        return maximum
+
+    def __min(self, partitions, siblings=None):
+        """
+        Finds the minimum distance between partitions. If siblings is passed, it will find the minimum distance between
+        the supplied partitions and their siblings.
+        :param partitions: list of partitions
+        :param siblings: list of sibling partitions
+        :return: minimum distance
+        """
+        # in case of balanced, compare children with each other
+        if not siblings:
+            siblings = partitions
+        minimum = float('+inf')
+
+        for p in partitions:
+            for q in siblings:
+                if p != q:
+                    distance = self.distance(p, q)
+                    if distance <= minimum:
+                        minimum = distance
+        return minimum
@@ -0,0 +1,225 @@
+from abc import abstractmethod
+
+import numpy as np
+
+from disparity.disparity import QuantifyingDisparity
+from disparity.emd import EMD
+from disparity.partition import PartitionTree
+
+SCALINGS = ['standardization', 'normalization', 'none']
+
+
+def kl(p, q):
+    """
+    Kullback-Leibler divergence of two probability histograms.
+    :param p: numpy array of probabilities
+    :param q: numpy array of probabilities
+    :return: KL(p || q), infinite if q is 0 in a bin where p is not.
+    """
+    support = p > 0
+    with np.errstate(divide='ignore'):
+        return float(np.sum(p[support] * np.log(p[support] / q[support])))
+
+
+def js(p, q):
+    """
+    Jensen-Shannon divergence of two probability histograms.
+    :param p: numpy array of probabilities
+    :param q: numpy array of probabilities
+    :return: JS(p, q)
+    """
+    m = (p + q) / 2
+    return (kl(p, m) + kl(q, m)) / 2
+
+
+def total_variation(p, q):
+    """
+    Total variation distance of two probability histograms.
+    :param p: numpy array of probabilities
+    :param q: numpy array of probabilities
+    :return: TV(p, q)
+    """
+    return float(np.sum(np.abs(p - q)) / 2)
+
+
+class Divergence(QuantifyingDisparity):
+    default_scaling = 'none'
+    default_smoothing = 0.0
+
+    def __init__(self, workers, attributes, configuration="transparent", f=None, selected=0.1, bins="preset",
+                 criterion='avg', scaling=None, smoothing=None, verbose=True):
+        """
+        Initializes a Divergence instance. Divergences compare the probability histograms of partitions, built from the
+        histograms cached by QuantifyingDisparity.
+        :param workers: list, a list of workers dicts
+        :param attributes: dict, attributes and their values. For example, {'Gender': ['Male', 'Female']}
+        :param configuration: string, can be one of [transparent, opaque_process, opaque_dataset].
+        :param f: list, scoring function parameters. For now, f is expected to have a length of 2.
+        :param selected: float, must be between 0 and 1. Percentage of workers who are accepted. Used when configuration
+               is opaque_process.
+        :param bins: string, can be one of [preset, auto]. With a scaling, preset bins keep their number but are spread
+               over the range of the scaled values.
+        :param criterion: string, must be one of [avg, max, min]
+        :param scaling: string, can be one of [standardization, normalization, none]. Scaling applied to the function
+               values of all workers before building histograms. None uses the default_scaling of the class.
+        :param smoothing: float, pseudo-count added to every bin of a histogram before it is normalized (1 is Laplace
+               smoothing). Without it, KL is infinite as soon as a partition has workers in a bin that another one
+               has not. None uses the default_smoothing of the class.
+        :param verbose: bool, if true the parameters of the instance are printed.
+        """
+        super().__init__(workers, attributes, configuration, f, selected, bins, criterion)
+        self.configure(scaling, smoothing)
+
+        if verbose:
+            print('RUNNING ' + self.__class__.__name__ + ' with the following parameters:')
+            print('scaling', self.scaling)
+            print('smoothing', self.smoothing)
+            print('f', f)
+            print('configuration', configuration)
+            print('criteria', criterion)
+            print('bins', bins)
+
+    def configure(self, scaling=None, smoothing=None):
+        """
+        Sets the scaling of the function values and the smoothing of the histograms, and drops the histograms built
+        with the previous ones.
+        :param scaling: string, can be one of [standardization, normalization, none]. None uses default_scaling.
+        :param smoothing: float, pseudo-count added to every bin. None uses default_smoothing.
+        """
+        if scaling is None:
+            scaling = self.default_scaling
+        if smoothing is None:
+            smoothing = self.default_smoothing
+        assert scaling in SCALINGS, "scaling must be one of [standardization, normalization, none]"
+        assert smoothing >= 0, "smoothing must be a non-negative number"
+        self.scaling = scaling
+        self.smoothing = smoothing
+
+        # workers keep their function values, scaling is applied whenever values are binned
+        values = QuantifyingDisparity.values(self.workers[0])
+        if scaling == 'standardization':
+            self.offset, self.scale = np.mean(values), np.std(values)
+        elif scaling == 'normalization':
+            self.offset, self.scale = np.min(values), np.max(values) - np.min(values)
+        else:
+            self.offset, self.scale = 0.0, 1.0
+        if self.scale == 0:
+            self.scale = 1.0
+        self._histograms = {}
+        self._bin_edges = None
+
+    def values(self, partition):
+        """
+        Returns the scaled function values of the workers in a partition.
+        :param partition: list of workers
+        :return: numpy array of scaled Accepted values
+        """
+        return (QuantifyingDisparity.values(partition) - self.offset) / self.scale
+
+    @property
+    def bin_edges(self):
+        if self.scaling == 'none' or self.bins == 'auto':
+            return super().bin_edges
+        if self._bin_edges is None:
+            # keep the number of preset bins, but spread them over the range of the scaled values
+            scaled = self.values(self.workers[0])
+            self._bin_edges = np.linspace(np.min(scaled), np.max(scaled), len(self.bins))
+        return self._bin_edges
+
+    def probabilities(self, partition):
+        """
+        Returns the smoothed, normalized histogram of a partition.
+        :param partition: list of workers
+        :return: numpy array of probabilities
+        """
+        return self.smooth(self.histogram(partition))
+
+    def smooth(self, histogram):
+        """
+        Turns a histogram of counts into probabilities, after adding smoothing to every bin.
+        :param histogram: numpy array of counts
+        :return: numpy array of probabilities
+        """
+        histogram = histogram + self.smoothing
+        return histogram / np.sum(histogram)
+
+    def settings(self):
+        return super().settings() + (self.scaling, self.smoothing)
+
+    def metric(self, partitions, siblings=None):
+        if self.bins == 'auto' and not isinstance(partitions, PartitionTree):
+            # the histograms of auto bins are batched as well, divergences compare histograms whatever the bins
+            self.histograms(list(partitions) + list(siblings or []))
+        return super().metric(partitions, siblings)
+
+    def distance(self, first_partition, second_partition):
+        return self.divergence(self.probabilities(first_partition), self.probabilities(second_partition))
+
+    @abstractmethod
+    def divergence(self, p, q):
+        """
+        Calculates the divergence between two probability histograms.
+        :param p: numpy array of probabilities
+        :param q: numpy array of probabilities
+        :return: divergence value
+        """
+        raise NotImplementedError
+
+
+class KL(Divergence):
+    default_scaling = 'standardization'
+    default_smoothing = 1.0
+
+    def divergence(self, p, q):
+        return kl(p, q)
+
+
+class JS(Divergence):
+    def divergence(self, p, q):
+        return js(p, q)
+
+
+class TV(Divergence):
+    def divergence(self, p, q):
+        return total_variation(p, q)
+
+
+METRICS = {
+    'EMD': EMD,
+    'KL': KL,
+    'JS': JS,
+    'TV': TV
+}
+
+
+def multi_metric(quantify_disparity, partitions, metrics=('EMD', 'KL', 'JS', 'TV'), siblings=None):
+    """
+    Quantifies the disparity of a partitioning with several metrics at once. Every metric gives the value that metric()
+    of an instance of its class gives: the metric of the class of quantify_disparity is computed by quantify_disparity
+    itself, and the others by copies of it (same workers, configuration, bins and criterion) that have the default
+    settings of their class (see QuantifyingDisparity.copy_as). Metrics that bin the function values with the same
+    scaling share their histograms, which are built once per scaling in a single batched pass.
+    :param quantify_disparity: QuantifyingDisparity instance whose workers are partitioned
+    :param partitions: list of partitions, or a PartitionTree
+    :param metrics: iterable of metric names, each one of [EMD, KL, JS, TV]
+    :param siblings: list of sibling partitions
+    :return: dict of metric name to disparity value
+    """
+    for name in metrics:
+        assert name in METRICS, "metrics must be a subset of " + str(list(METRICS)) + ", got " + str(name)
+
+    if isinstance(partitions, PartitionTree):
+        partitions = partitions.partitions()
+    # histograms per scaling, starting with those quantify_disparity already built. EMD bins the raw values.
+    histograms = {getattr(quantify_disparity, 'scaling', 'none'): quantify_disparity._histograms}
+
+    values = {}
+    for name in metrics:
+        metric_class = METRICS[name]
+        if type(quantify_disparity) is metric_class:
+            instance = quantify_disparity
+        else:
+            instance = quantify_disparity.copy_as(metric_class)
+            instance._histograms = histograms.setdefault(getattr(instance, 'scaling', 'none'), instance._histograms)
+        values[name] = instance.metric(partitions, siblings)
+    return values
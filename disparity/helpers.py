@@ -2,9 +2,6 @@ import csv
 import math
 import time
 import json
-import numpy as np
-from beautifultable import BeautifulTable
-from pymongo import MongoClient
 
 class Helper:
     def __init__(self,
@@ -25,13 +22,30 @@ class Helper:
         self.db_name = db_name
         self.configuration = configuration
         self.limit = N
-        self.collection = self.__get_collection(db_name, collection_name)
+        self.collection_name = collection_name
+        self.__collection = None
         self.k = k
         self.selected = selected
         self.f = f
+        # PartitionTree results of the last run_experiments call, per variant and algorithm (random algorithms excluded)
+        self.partitionings = {}
+        # disparity of every random run of the last run_experiments call, per variant and random algorithm
+        self.random_distributions = {}
+
+    @property
+    def collection(self):
+        """
+        MongoDB collection of the workers. The connection is only opened the first time it is needed, so that data
+        sources that do not live in MongoDB (e.g. the opaque_dataset CSV files) do not require pymongo.
+        """
+        if self.__collection is None:
+            self.__collection = self.__get_collection(self.db_name, self.collection_name)
+        return self.__collection
 
     @staticmethod
     def __get_collection(db_name, collection_name):
+        from pymongo import MongoClient
+
         client = MongoClient()
         db = client[db_name]
         return db[collection_name]
@@ -73,6 +87,17 @@ class Helper:
                     documents.append(w)
         return documents
 
+    def get_ranking_log(self, collection_name='rankings', chunk_size=10000):
+        """
+        Returns the ranking log stored in a collection of the database, read in chunks.
+        :param collection_name: name of the collection of (query, ranked workers) documents.
+        :param chunk_size: number of documents read and scored at once.
+        :return: RankingLog
+        """
+        from disparity.ranking import RankingLog
+
+        return RankingLog(self.__get_collection(self.db_name, collection_name), chunk_size=chunk_size)
+
     def get_documents(self):
         if self.db_name.startswith('WorkerSet'):
             return self.__retrieve_simulated_dataset()
@@ -132,6 +157,8 @@ class Helper:
         :return:
         """
 
+        from beautifultable import BeautifulTable
+
         def build_table(title, values):
             b_table = BeautifulTable(max_width=200)
             t_headers = [title]
@@ -160,31 +187,100 @@ class Helper:
 
         return str(table), str(timetable)
 
+    def build_distribution_table(self, functions=None, percentages=None):
+        """
+        Builds a table of the distribution of the disparity of the random runs of the last run_experiments call, one
+        row per random algorithm and variant.
+        :param functions:
+        :param percentages:
+        :return: string
+        """
+        from beautifultable import BeautifulTable
+
+        from disparity.montecarlo import summarize
+
+        variants = percentages if self.configuration == 'opaque_process' else functions
+        table = BeautifulTable(max_width=200)
+        table.numeric_precision = 4
+        rows = []
+        for key in variants:
+            for algorithm, values in self.random_distributions.get(key, {}).items():
+                variant = str(key) + '%' if self.configuration == 'opaque_process' else 'f' + str(key)
+                summary = summarize(values)
+                if not rows:
+                    table.column_headers = ['RANDOM RUNS'] + list(summary)
+                rows.append([algorithm + ' ' + variant] + list(summary.values()))
+        for row in rows:
+            table.append_row(row)
+
+        print('-----------------------')
+        print('RANDOM RUNS')
+        print(table)
+
+        return str(table)
+
     @staticmethod
-    def run_algorithm(algorithm, method, num_of_runs=1):
+    def run_algorithm(algorithm, method, num_of_runs=1, results=None):
         """
 
         :param algorithm:
         :param method:
         :param num_of_runs:
+        :param results: list, if passed the PartitionTree of every run is appended to it.
         :return:
         """
+        import numpy as np
+
         value_per_run = []
         time_per_run = []
         for i in range(num_of_runs):
             start = time.time()
-            value_per_run.append(algorithm.metric(method()))
+            partitioning = method()
+            value_per_run.append(algorithm.metric(partitioning))
             end = time.time()
             time_per_run.append(end - start)
+            if results is not None:
+                results.append(partitioning)
 
         return np.mean(value_per_run), np.mean(time_per_run)
 
-    def run_experiments(self, quantify_disparity_metric, workers, attributes, functions=None, percentages=None,
-                        bins='preset', criterion='avg', normalize=True, scaling='standardization'):
+    @staticmethod
+    def run_random_algorithm(algorithm, variant, num_of_runs=1000, seed=None, processes=None):
+        """
+        Runs random_balanced or random_unbalanced many times with the MonteCarlo engine, which shares the work of runs
+        that make the same random choices.
+        :param algorithm:
+        :param variant: string, can be one of [balanced, unbalanced]
+        :param num_of_runs:
+        :param seed: seed of the random runs.
+        :param processes: number of processes the runs are spread over.
+        :return: mean value, total time of all the runs, and the value of every run
         """
+        from disparity.montecarlo import MonteCarlo
+
+        start = time.time()
+        values = MonteCarlo(algorithm).run(variant, num_of_runs, seed=seed, processes=processes)
+        end = time.time()
 
-        :param normalize:
-        :param scaling:
+        return values.mean(), end - start, values
+
+    def run_experiments(self, quantify_disparity_metric, workers, attributes, functions=None, percentages=None,
+                        bins='preset', criterion='avg', normalize=True, scaling=None, random_runs=1000,
+                        seed=None, processes=None, cache=None):
+        """
+        Runs every algorithm on every variant. The PartitionTree of the unbalanced, balanced and exhaustive algorithms
+        are kept in partitionings. The random algorithms are evaluated by the MonteCarlo engine, which does not build
+        trees: only the disparity of their runs is kept, in random_distributions (see build_distribution_table).
+
+        :param cache: path of an EMDCache database, or an EMDCache, shared by all the variants and kept across runs.
+
+        :param random_runs: number of runs of the random algorithms. Their mean is reported in the values table, along
+               with the total time of all the runs in the timings table, and all of them are kept in
+               random_distributions.
+        :param seed: seed of the random algorithms.
+        :param processes: number of processes the runs of the random algorithms are spread over.
+        :param normalize: used by EMD.
+        :param scaling: used by the divergences, None uses the default scaling of the metric.
         :param criterion:
         :param quantify_disparity_metric:
         :param workers:
@@ -215,24 +311,41 @@ class Helper:
             ["exhaustive"]
         ]
 
+        for i in [1, 3]:
+            all_time_values[i][0] += ' (' + str(random_runs) + ' runs)'
+
+        from disparity.emd import EMD
+
+        assert cache is None or issubclass(quantify_disparity_metric, EMD), \
+            "cache only stores EMD values, it can not be used with " + quantify_disparity_metric.__name__
+        if isinstance(cache, str):
+            from disparity.cache import EMDCache
+
+            cache = EMDCache(cache)
+
+        metric_name = quantify_disparity_metric.__name__
         name = 'undefined'
+        self.partitionings = {}
+        self.random_distributions = {}
         for key in variants:
-            if quantify_disparity_metric.__name__ == 'KL':
-                name = self.db_name + '-KL-' + self.configuration + '-scaling-' + scaling + '-workers-' + str(self.limit)
+            if issubclass(quantify_disparity_metric, EMD):
+                name = self.db_name + '-' + metric_name + '-' + self.configuration + '-bins-' + bins + '-normalize-' + str(normalize) + '-criterion-' \
+                       + criterion + str(self.limit)
                 quantify_disparity = quantify_disparity_metric(workers, attributes,
                                                                configuration=self.configuration,
                                                                f=variants[key],
                                                                selected=variants[key],
-                                                               bins=bins,
-                                                               scaling=scaling)
+                                                               bins=bins, normalize=normalize, criterion=criterion,
+                                                               cache=cache)
             else:
-                name = self.db_name + '-EMD-' + self.configuration + '-bins-' + bins + '-normalize-' + str(normalize) + '-criterion-' \
-                       + criterion + str(self.limit)
                 quantify_disparity = quantify_disparity_metric(workers, attributes,
                                                                configuration=self.configuration,
                                                                f=variants[key],
                                                                selected=variants[key],
-                                                               bins=bins, normalize=normalize, criterion=criterion)
+                                                               bins=bins, criterion=criterion,
+                                                               scaling=scaling)
+                name = self.db_name + '-' + metric_name + '-' + self.configuration + '-scaling-' + \
+                       quantify_disparity.scaling + '-criterion-' + criterion + '-workers-' + str(self.limit)
 
             methods = [
                 quantify_disparity.unbalanced,
@@ -243,9 +356,18 @@ class Helper:
             ]
 
             for i in range(len(methods)):
-                num_of_times = 5 if i in [1, 3] else 1
-                value, exec_time = self.run_algorithm(quantify_disparity, methods[i], num_of_times)
+                if i in [1, 3]:
+                    variant = 'unbalanced' if i == 1 else 'balanced'
+                    value, exec_time, values = self.run_random_algorithm(quantify_disparity, variant, random_runs,
+                                                                         seed, processes)
+                    self.random_distributions.setdefault(key, {})[all_values[i][0]] = values
+                else:
+                    results = self.partitionings.setdefault(key, {}).setdefault(all_values[i][0], [])
+                    value, exec_time = self.run_algorithm(quantify_disparity, methods[i], 1, results)
                 all_values[i].append(value)
                 all_time_values[i].append(exec_time)
 
+        if cache is not None:
+            print('EMD cache:', cache.stats())
+
         return name, all_values, all_time_values
@@ -0,0 +1,207 @@
+import multiprocessing
+
+import numpy as np
+
+VARIANTS = ['balanced', 'unbalanced']
+
+
+class PrefixTrie:
+    __slots__ = ['attributes', 'partitions', 'value', 'children']
+
+    def __init__(self, attributes, partitions, value=None):
+        """
+        Initializes a PrefixTrie node, the partitioning obtained by splitting on a prefix of an attribute ordering.
+        :param attributes: frozenset of the attributes of the prefix
+        :param partitions: list of partitions
+        :param value: disparity of the partitions
+        """
+        self.attributes = attributes
+        self.partitions = partitions
+        self.value = value
+        self.children = {}
+
+
+class MonteCarlo:
+    def __init__(self, quantify_disparity):
+        """
+        Initializes a MonteCarlo engine, that evaluates many random_balanced and random_unbalanced runs of a
+        QuantifyingDisparity instance. Random runs that share a prefix of attribute choices share the splits and the
+        disparities computed for that prefix: balanced runs walk a trie of attribute orderings, and unbalanced runs
+        memoize the decision taken for every (group, attribute) pair and the distance between every pair of groups.
+        :param quantify_disparity: QuantifyingDisparity instance
+        """
+        self.quantify_disparity = quantify_disparity
+        self.attributes = list(quantify_disparity.original_attributes)
+        self.root = PrefixTrie(frozenset(), quantify_disparity.workers)
+        # prefixes made of the same attributes give the same partitioning, so they share their trie node
+        self.nodes = {}
+        # (group label, attribute) to (whether splitting increases disparity, list of (child label, child partition))
+        self.decisions = {}
+        # group label to the labelled children of the split that produced it
+        self.siblings = {}
+        # groups are numbered, regardless of the order of their splits, so that distances are kept in a matrix
+        self.groups = {}
+        self.distances = np.full((0, 0), np.nan)
+        # disparity of every set of leaves already reached by a run
+        self.values = {}
+
+    def __child(self, node, attribute):
+        if attribute not in node.children:
+            attributes = node.attributes | {attribute}
+            if attributes not in self.nodes:
+                partitions = self.quantify_disparity.split(node.partitions, attribute)
+                self.nodes[attributes] = PrefixTrie(attributes, partitions, self.quantify_disparity.metric(partitions))
+            node.children[attribute] = self.nodes[attributes]
+        return node.children[attribute]
+
+    def balanced_run(self, rng):
+        """
+        Runs the balanced algorithm with random attributes, drawn from rng.
+        :param rng: numpy Generator
+        :return: disparity of the partitioning
+        """
+        remaining = list(self.attributes)
+        node = self.__child(self.root, remaining.pop(rng.integers(len(remaining))))
+        while len(remaining) > 0:
+            child = self.__child(node, remaining.pop(rng.integers(len(remaining))))
+            if node.value >= child.value:
+                break
+            node = child
+        return node.value
+
+    def __split(self, label, partition, attribute):
+        children = []
+        for child in self.quantify_disparity.split([partition], attribute):
+            children.append((label + ((attribute, child[0][attribute]),), child))
+        for child_label, _ in children:
+            self.siblings[child_label] = children
+        return children
+
+    def __decide(self, label, partition, attribute):
+        if (label, attribute) not in self.decisions:
+            siblings = [p for l, p in self.siblings[label] if l != label]
+            children = self.__split(label, partition, attribute)
+            current_max = self.quantify_disparity.metric([partition], siblings)
+            children_max = self.quantify_disparity.metric([p for _, p in children], siblings)
+            self.decisions[(label, attribute)] = (current_max < children_max, children)
+        return self.decisions[(label, attribute)]
+
+    def __group(self, label):
+        # the same splits in another order give the same group of workers
+        label = frozenset(label)
+        if label not in self.groups:
+            self.groups[label] = len(self.groups)
+            if len(self.groups) > len(self.distances):
+                distances = np.full((2 * len(self.groups), 2 * len(self.groups)), np.nan)
+                distances[:len(self.distances), :len(self.distances)] = self.distances
+                self.distances = distances
+        return self.groups[label]
+
+    def __value(self, leaves):
+        """
+        Calculates the disparity of a set of leaves, computing only the distances between groups that were never
+        compared before.
+        """
+        ids = [self.__group(label) for label, _ in leaves]
+        key = frozenset(ids)
+        if key not in self.values:
+            for i, (p, first) in zip(ids, leaves):
+                for j, (q, second) in zip(ids, leaves):
+                    if i != j and np.isnan(self.distances[i, j]):
+                        self.distances[i, j] = self.quantify_disparity.distance(first, second)
+            pairs = self.distances[np.ix_(ids, ids)]
+            self.values[key] = self.quantify_disparity.aggregate(pairs[~np.eye(len(ids), dtype=bool)].tolist())
+        return self.values[key]
+
+    def unbalanced_run(self, rng):
+        """
+        Runs the unbalanced algorithm with random attributes, drawn from rng.
+        :param rng: numpy Generator
+        :return: disparity of the partitioning
+        """
+        remaining = list(self.attributes)
+        a = remaining.pop(rng.integers(len(remaining)))
+        leaves = []
+        top = self.__split((), self.quantify_disparity.workers[0], a)
+        stack = [(label, partition, remaining) for label, partition in reversed(top)]
+        while stack:
+            label, partition, remaining = stack.pop()
+            if len(remaining) == 0:
+                leaves.append((label, partition))
+                continue
+            remaining = list(remaining)
+            a = remaining.pop(rng.integers(len(remaining)))
+            split, children = self.__decide(label, partition, a)
+            if split:
+                stack.extend((child_label, child, remaining) for child_label, child in reversed(children))
+            else:
+                leaves.append((label, partition))
+
+        return self.__value(leaves)
+
+    def run(self, variant='balanced', runs=1000, seed=None, processes=None):
+        """
+        Evaluates many random runs. Every run draws its attributes from its own RNG stream, spawned from seed, so the
+        values do not depend on the number of processes.
+        :param variant: string, can be one of [balanced, unbalanced]
+        :param runs: int, number of random runs.
+        :param seed: int, seed of the RNG streams. None draws fresh entropy.
+        :param processes: int, number of processes the runs are spread over. Every process keeps its own trie.
+        :return: numpy array of the disparity of every run
+        """
+        assert variant in VARIANTS, "variant must be one of [balanced, unbalanced]"
+        assert runs > 0, "runs must be a positive integer"
+        streams = np.random.SeedSequence(seed).spawn(runs)
+        if not processes or processes <= 1:
+            return np.array(self.evaluate(variant, streams))
+
+        chunks = [streams[i::processes] for i in range(processes)]
+        with multiprocessing.Pool(processes, initializer=_initialize, initargs=(self.quantify_disparity,)) as pool:
+            values = pool.starmap(_runs, [(variant, chunk) for chunk in chunks])
+        # chunks were dealt round-robin, put the runs back in the order of their streams
+        ordered = np.empty(runs)
+        for i, chunk_values in enumerate(values):
+            ordered[i::processes] = chunk_values
+        return ordered
+
+    def evaluate(self, variant, streams):
+        """
+        Evaluates one random run per RNG stream.
+        :param variant: string, can be one of [balanced, unbalanced]
+        :param streams: list of numpy SeedSequence
+        :return: list of the disparity of every run
+        """
+        run = self.balanced_run if variant == 'balanced' else self.unbalanced_run
+        return [run(np.random.default_rng(stream)) for stream in streams]
+
+
+def summarize(values, percentiles=(5, 25, 50, 75, 95)):
+    """
+    Summarizes the distribution of the disparity of random runs.
+    :param values: numpy array of disparities
+    :param percentiles: iterable of percentiles to report
+    :return: dict
+    """
+    summary = {'runs': len(values), 'mean': float(np.mean(values)), 'std': float(np.std(values)),
+               'min': float(np.min(values)), 'max': float(np.max(values))}
+    for p, value in zip(percentiles, np.percentile(values, percentiles)):
+        summary['p' + str(p)] = float(value)
+    return summary
+
+
+# engine of the pool workers, set once per process by _initialize
+_engine = None
+
+
+def _initialize(quantify_disparity):
+    global _engine
+    _engine = MonteCarlo(quantify_disparity)
+
+
+def _runs(variant, streams):
+    values = _engine.evaluate(variant, streams)
+    # pool workers exit without running atexit hooks, so the values they added to the EMD cache are written now
+    cache = getattr(_engine.quantify_disparity, 'cache', None)
+    if cache is not None:
+        cache.flush()
+    return values
@@ -0,0 +1,177 @@
+import numpy as np
+
+
+class PartitionNode:
+    __slots__ = ['label', 'size', 'histogram', 'contribution', 'indices', 'children']
+
+    def __init__(self, label, indices, histogram, contribution=None, children=None):
+        """
+        Initializes a PartitionNode, a group of workers of a partitioning tree.
+        :param label: tuple of (attribute, value) pairs, the splits that lead from the root to this node.
+        :param indices: numpy array, positions of the workers of this node in the workers of the tree.
+        :param histogram: numpy array, histogram of the function values of the workers of this node.
+        :param contribution: float, disparity between this group and the other groups of the partitioning. Only set on
+               leaves.
+        :param children: list of PartitionNode
+        """
+        self.label = label
+        self.indices = indices
+        self.size = len(indices)
+        self.histogram = histogram
+        self.contribution = contribution
+        self.children = children or []
+
+    def __repr__(self):
+        return 'PartitionNode(' + self.name + ', size=' + str(self.size) + ', contribution=' + \
+               str(self.contribution) + ')'
+
+    @property
+    def name(self):
+        return ' & '.join(str(attribute) + '=' + str(value) for attribute, value in self.label) or 'All'
+
+    @property
+    def attribute(self):
+        return self.label[-1][0] if self.label else None
+
+    @property
+    def value(self):
+        return self.label[-1][1] if self.label else None
+
+    @property
+    def is_leaf(self):
+        return not self.children
+
+    def to_dict(self):
+        """
+        Returns a JSON serializable representation of the node and its descendants. Worker membership is left out.
+        :return: dict
+        """
+        return {
+            'label': [[attribute, value] for attribute, value in self.label],
+            'size': self.size,
+            'histogram': self.histogram.tolist(),
+            'contribution': self.contribution,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+
+class PartitionTree:
+    def __init__(self, workers, leaves, value, settings=None):
+        """
+        Initializes a PartitionTree, the result of a partitioning algorithm. Leaves are the partitions that were found,
+        and internal nodes are the groups they were split from. Nodes only hold the positions of their workers, so
+        that results are cheap to keep; partitions() materializes them on demand.
+        :param workers: list, the workers dicts that were partitioned. Shared with the QuantifyingDisparity instance.
+        :param leaves: list of PartitionNode, in the order the algorithm produced them.
+        :param value: float, disparity of the partitioning.
+        :param settings: tuple, settings of the metric that computed value and the contributions of the leaves (see
+               QuantifyingDisparity.settings).
+        """
+        self._workers = workers
+        self.leaves = leaves
+        self.value = value
+        self.settings = settings
+        self.root = self.__build(leaves)
+        # quality-vs-time curve of the search that produced the tree, if it was an anytime search
+        self.trace = None
+
+    @staticmethod
+    def __build(leaves):
+        """
+        Rebuilds the internal nodes from the labels of the leaves, grouping leaves that share a prefix.
+        """
+        def build(label, group):
+            if len(group) == 1 and len(group[0].label) == len(label):
+                return group[0]
+            children = []
+            by_split = {}
+            for leaf in group:
+                split = leaf.label[len(label)]
+                if split not in by_split:
+                    by_split[split] = []
+                    children.append(split)
+                by_split[split].append(leaf)
+            children = [build(label + (split,), by_split[split]) for split in children]
+            return PartitionNode(label,
+                                 np.concatenate([child.indices for child in children]),
+                                 np.sum([child.histogram for child in children], axis=0),
+                                 children=children)
+
+        return build((), leaves)
+
+    def __len__(self):
+        return len(self.leaves)
+
+    def __iter__(self):
+        for leaf in self.leaves:
+            yield self.workers(leaf)
+
+    def __getitem__(self, i):
+        return self.workers(self.leaves[i])
+
+    def __eq__(self, other):
+        if not isinstance(other, PartitionTree):
+            return NotImplemented
+        return self.signature() == other.signature()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'PartitionTree(' + str(len(self)) + ' partitions, value=' + str(self.value) + ')'
+
+    def quantified_by(self, quantify_disparity):
+        """
+        Checks whether the value of the tree is the one a QuantifyingDisparity instance computes, i.e. whether the tree
+        partitions its workers and was quantified with the same settings.
+        :param quantify_disparity: QuantifyingDisparity instance
+        :return: bool
+        """
+        return self._workers is quantify_disparity.workers[0] and self.settings == quantify_disparity.settings()
+
+    def workers(self, node):
+        """
+        Materializes the workers of a node.
+        :param node: PartitionNode
+        :return: list of workers dicts
+        """
+        return [self._workers[i] for i in node.indices]
+
+    def partitions(self):
+        """
+        Materializes the partitions, i.e. the list of lists of workers that the algorithms used to return.
+        :return: list of partitions
+        """
+        return list(self)
+
+    def signature(self):
+        """
+        Identifies the partitioning by the labels and sizes of its leaves, regardless of their order.
+        :return: frozenset of (label, size)
+        """
+        return frozenset((leaf.label, leaf.size) for leaf in self.leaves)
+
+    def unfairest(self, n=1):
+        """
+        Returns the groups that contribute the most to the disparity.
+        :param n: int, number of groups to return.
+        :return: list of PartitionNode
+        """
+        return sorted(self.leaves, key=lambda leaf: leaf.contribution, reverse=True)[:n]
+
+    def nodes(self):
+        """
+        Iterates over all nodes of the tree, parents before their children.
+        :return: generator of PartitionNode
+        """
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def to_dict(self):
+        """
+        Returns a JSON serializable representation of the tree. Worker membership is left out.
+        :return: dict
+        """
+        return {'value': self.value, 'settings': list(self.settings or []), 'root': self.root.to_dict()}
@@ -0,0 +1,189 @@
+import csv
+import itertools
+
+import numpy as np
+
+DISCOUNTS = ['exposure', 'position']
+
+
+def discount(ranks, scheme='exposure'):
+    """
+    Turns rank positions into scores. Both schemes give a score of 1 to the first position and decrease towards 0, so
+    they can be binned like any other function value.
+    :param ranks: numpy array of 1-based rank positions
+    :param scheme: string, can be one of [exposure, position]. exposure is the DCG discount 1 / log2(1 + rank), position
+           is 1 / rank.
+    :return: numpy array of scores
+    """
+    assert scheme in DISCOUNTS, "scheme must be one of [exposure, position]"
+    ranks = np.asarray(ranks, dtype=np.float64)
+    if scheme == 'exposure':
+        return 1 / np.log2(1 + ranks)
+    return 1 / ranks
+
+
+class RankingLog:
+    def __init__(self, source, query_field='query', ranking_field='workers', separator='|', chunk_size=10000):
+        """
+        Initializes a RankingLog, a stream of (query, ranked list of workers) rows.
+        :param source: string or collection, either the path of a CSV file or a MongoDB collection. In a CSV file, the
+               ranked list is a single column of worker ids joined by separator. In MongoDB, it is an array of ids.
+        :param query_field: string, name of the column (or field) holding the query.
+        :param ranking_field: string, name of the column (or field) holding the ranked worker ids, best first.
+        :param separator: string, separator of the worker ids in a CSV column.
+        :param chunk_size: int, number of rows read and scored at once.
+        """
+        assert chunk_size > 0, "chunk_size must be a positive integer"
+        self.source = source
+        self.query_field = query_field
+        self.ranking_field = ranking_field
+        self.separator = separator
+        self.chunk_size = chunk_size
+
+    def __rows(self):
+        if isinstance(self.source, str):
+            with open(self.source, mode='r') as f:
+                for row in csv.DictReader(f):
+                    ranking = row[self.ranking_field]
+                    yield row[self.query_field], ranking.split(self.separator) if ranking else []
+        else:
+            cursor = self.source.find({}, {self.query_field: 1, self.ranking_field: 1}).batch_size(self.chunk_size)
+            for document in cursor:
+                yield document[self.query_field], [str(w) for w in document.get(self.ranking_field, [])]
+
+    def chunks(self):
+        """
+        Reads the log in chunks of chunk_size rows, so that logs that do not fit in memory can be scored.
+        :return: generator of (list of queries, list of ranked lists of worker ids)
+        """
+        rows = self.__rows()
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            queries, rankings = zip(*chunk)
+            yield list(queries), list(rankings)
+
+    def __scored_chunks(self, scheme):
+        """
+        Scores the log one chunk at a time. Rank positions of a whole chunk are computed and discounted at once.
+        :return: generator of (numpy array of the query of every row, numpy array of the length of every ranked list,
+                 numpy array of worker ids, numpy array of scores)
+        """
+        for queries, rankings in self.chunks():
+            lengths = np.fromiter((len(ranking) for ranking in rankings), dtype=np.int64, count=len(rankings))
+            starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+            ranks = np.arange(lengths.sum()) - starts + 1
+            workers = np.array(list(itertools.chain.from_iterable(rankings)), dtype=str)
+            yield np.array(queries, dtype=str), lengths, workers, discount(ranks, scheme)
+
+    def scores(self, scheme='exposure'):
+        """
+        Scores every (query, worker) occurrence of the log, one chunk at a time. Rank positions of a whole chunk are
+        computed and discounted at once.
+        :param scheme: string, can be one of [exposure, position]
+        :return: generator of (numpy array of queries, numpy array of worker ids, numpy array of scores)
+        """
+        for queries, lengths, workers, scores in self.__scored_chunks(scheme):
+            if len(workers) > 0:
+                yield np.repeat(queries, lengths), workers, scores
+
+    def exposure_by_query(self, scheme='exposure'):
+        """
+        Aggregates the scores of the log per query. When a query was logged several times, a worker gets the average
+        score over all the rows of that query, rows in which they were not ranked counting as 0. Sums are kept in
+        arrays: the scores of new chunks are appended, and reduced per (query, worker) pair whenever they outgrow the
+        pairs reduced so far.
+        :param scheme: string, can be one of [exposure, position]
+        :return: dict of query to dict of worker id to score, queries and ids are strings
+        """
+        pending = [(np.array([], dtype=str), np.array([], dtype=str), np.array([]))]
+        pending_size = reduced_size = 0
+        logged, rows = np.array([], dtype=str), np.array([])
+        for chunk_queries, lengths, chunk_workers, scores in self.__scored_chunks(scheme):
+            logged, rows = _sum_by_query(np.concatenate([logged, chunk_queries]),
+                                         np.concatenate([rows, np.ones(len(chunk_queries))]))
+            pending.append((np.repeat(chunk_queries, lengths), chunk_workers, scores))
+            pending_size += len(scores)
+            if pending_size > 2 * reduced_size:
+                pending = [_sum_by_pair(*map(np.concatenate, zip(*pending)))]
+                pending_size = reduced_size = len(pending[0][0])
+        queries, workers, sums = _sum_by_pair(*map(np.concatenate, zip(*pending)))
+
+        exposures = {}
+        if len(queries) > 0:
+            averages = sums / rows[np.searchsorted(logged, queries)]
+            # pairs are sorted by query, so the workers of a query are a contiguous slice
+            bounds = np.flatnonzero(queries[1:] != queries[:-1]) + 1
+            for query, query_workers, query_averages in zip(queries[np.r_[0, bounds]].tolist(),
+                                                            np.split(workers, bounds), np.split(averages, bounds)):
+                exposures[query] = dict(zip(query_workers.tolist(), query_averages.tolist()))
+        return exposures
+
+    def accepted_by_query(self, workers, scheme='exposure', id_field='id', include_unranked=False):
+        """
+        Builds, for every query, the workers to audit with their Exposure set, ready to be passed to a
+        QuantifyingDisparity instance with the ranking configuration.
+        :param workers: list of workers dicts, with their attributes
+        :param scheme: string, can be one of [exposure, position]
+        :param id_field: string, field of the workers matching the ids of the ranked lists.
+        :param include_unranked: bool, if true workers that were not ranked for a query are included with a score of 0.
+        :return: dict of query to list of workers dicts
+        """
+        by_id = {str(worker[id_field]): worker for worker in workers}
+        accepted = {}
+        for query, exposures in self.exposure_by_query(scheme).items():
+            ranked = [dict(by_id[w], Exposure=exposures[w]) for w in exposures if w in by_id]
+            if include_unranked:
+                ranked += [dict(worker, Exposure=0.0) for w, worker in by_id.items() if w not in exposures]
+            accepted[query] = ranked
+        return accepted
+
+
+def _sum_by_query(queries, values):
+    """
+    Sums values per query.
+    :return: tuple of (sorted numpy array of distinct queries, numpy array of sums)
+    """
+    distinct, inverse = np.unique(queries, return_inverse=True)
+    return distinct, np.bincount(inverse.reshape(-1), weights=values, minlength=len(distinct))
+
+
+def _sum_by_pair(queries, workers, values):
+    """
+    Sums values per (query, worker) pair. Pairs are numbered by the positions of their query and worker among the
+    distinct ones, so that they are reduced with integer operations only.
+    :return: tuple of (numpy array of queries, numpy array of worker ids, numpy array of sums), sorted by query and
+             worker
+    """
+    distinct_queries, query_codes = np.unique(queries, return_inverse=True)
+    distinct_workers, worker_codes = np.unique(workers, return_inverse=True)
+    n = max(len(distinct_workers), 1)
+    codes, inverse = np.unique(query_codes.reshape(-1) * n + worker_codes.reshape(-1), return_inverse=True)
+    return distinct_queries[codes // n], distinct_workers[codes % n], \
+        np.bincount(inverse.reshape(-1), weights=values, minlength=len(codes))
+
+
+def audit(quantify_disparity_metric, log, workers, attributes, algorithm='balanced', scheme='exposure', min_workers=2,
+          **kwargs):
+    """
+    Quantifies the disparity of every query of a ranking log.
+    :param quantify_disparity_metric: QuantifyingDisparity subclass, e.g. EMD
+    :param log: RankingLog
+    :param workers: list of workers dicts, with their attributes
+    :param attributes: dict, attributes and their values. For example, {'Gender': ['Male', 'Female']}
+    :param algorithm: string, name of the partitioning method, e.g. balanced, unbalanced or exhaustive
+    :param scheme: string, can be one of [exposure, position]
+    :param min_workers: int, queries that ranked fewer workers are skipped.
+    :param kwargs: extra arguments of quantify_disparity_metric, e.g. criterion. Instances are not verbose unless
+           verbose is passed.
+    :return: dict of query to disparity value
+    """
+    kwargs.setdefault('verbose', False)
+    values = {}
+    for query, ranked in log.accepted_by_query(workers, scheme=scheme).items():
+        if len(ranked) < min_workers:
+            continue
+        quantify_disparity = quantify_disparity_metric(ranked, attributes, configuration='ranking', **kwargs)
+        values[query] = quantify_disparity.metric(getattr(quantify_disparity, algorithm)())
+    return values
@@ -0,0 +1,152 @@
+import logging
+import multiprocessing
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Budget:
+    def __init__(self, time_budget=None, max_evaluations=None):
+        """
+        Initializes a Budget, a bound on the runtime of an anytime search.
+        :param time_budget: float, wall-clock seconds after which the search returns. None means unlimited.
+        :param max_evaluations: int, number of candidate partitionings the search may evaluate. None means unlimited.
+        """
+        assert time_budget is None or time_budget >= 0, "time_budget must be a non-negative number of seconds"
+        assert max_evaluations is None or max_evaluations >= 0, "max_evaluations must be a non-negative integer"
+        self.time_budget = time_budget
+        self.max_evaluations = max_evaluations
+        self.start = time.time()
+        self.evaluations = 0
+        # quality-vs-time curve, one (elapsed seconds, evaluations, best value) tuple per improvement
+        self.trace = []
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start
+
+    @property
+    def exhausted(self):
+        return (self.time_budget is not None and self.elapsed >= self.time_budget) or \
+               (self.max_evaluations is not None and self.evaluations >= self.max_evaluations)
+
+    def spend(self, evaluations=1):
+        self.evaluations += evaluations
+
+    def record(self, value):
+        self.trace.append((self.elapsed, self.evaluations, value))
+        logger.info('%.3fs, %d evaluations: best disparity %s', self.elapsed, self.evaluations, value)
+
+
+# instance evaluated by the pool workers, set once per process by _initialize
+_quantify_disparity = None
+
+
+def _initialize(quantify_disparity):
+    global _quantify_disparity
+    _quantify_disparity = quantify_disparity
+
+
+def _evaluate(path):
+    partitions = _quantify_disparity.workers
+    for attribute in path:
+        partitions = _quantify_disparity.split(partitions, attribute)
+    value = _quantify_disparity.metric(partitions)
+    # pool workers exit without running atexit hooks, so the values they added to the EMD cache are written now
+    cache = getattr(_quantify_disparity, 'cache', None)
+    if cache is not None:
+        cache.flush()
+    return value
+
+
+def beam_search(quantify_disparity, beam_width=1, time_budget=None, max_evaluations=None, processes=None):
+    """
+    Anytime beam search over balanced partitionings. A state is the list of attributes the workers are split on. At
+    every level, each state of the beam is expanded with every remaining attribute, children that do not increase the
+    disparity of their parent are pruned, and the beam_width best children are kept. The best partitioning found so far
+    is returned once the beam is empty or the budget is exhausted. With beam_width 1 and no budget, this is the
+    greedy balanced algorithm.
+    :param quantify_disparity: QuantifyingDisparity instance
+    :param beam_width: int, number of states kept at every level.
+    :param time_budget: float, wall-clock seconds after which the best partitioning so far is returned.
+    :param max_evaluations: int, number of candidate partitionings after which the best one so far is returned.
+    :param processes: int, number of processes evaluating the candidates of a level. None or 1 evaluates them in the
+           current process.
+    :return: PartitionTree, with the quality-vs-time curve of the search in its trace.
+    """
+    assert beam_width >= 1, "beam_width must be a positive integer"
+    budget = Budget(time_budget, max_evaluations)
+    pool = multiprocessing.Pool(processes, initializer=_initialize, initargs=(quantify_disparity,)) \
+        if processes and processes > 1 else None
+
+    # states are (path, partitions, value), partitions are only kept when candidates are evaluated in process
+    beam = [((), quantify_disparity.workers, None)]
+    best = None
+    seen = set()
+    try:
+        while beam and not (best and budget.exhausted):
+            candidates = []
+            for path, partitions, value in beam:
+                for a in quantify_disparity.original_attributes:
+                    if a not in path and frozenset(path + (a,)) not in seen:
+                        # splitting on the same attributes in another order gives the same partitioning
+                        seen.add(frozenset(path + (a,)))
+                        candidates.append((path + (a,), partitions, value))
+
+            if pool is None:
+                evaluated = _evaluate_in_process(quantify_disparity, candidates, budget, best)
+            else:
+                evaluated = _evaluate_in_pool(pool, candidates, budget, best, processes)
+
+            children = []
+            for i, (path, partitions, value, parent_value) in enumerate(evaluated):
+                # the first split is always taken, deeper ones only if they increase the disparity
+                if parent_value is None or value > parent_value:
+                    children.append((value, i, path, partitions))
+                    if best is None or value > best[0]:
+                        best = (value, path, partitions)
+                        budget.record(value)
+
+            # among equal values, prefer the last attribute, like the greedy algorithm does
+            children.sort(key=lambda child: (child[0], child[1]), reverse=True)
+            beam = [(path, partitions, value) for value, _, path, partitions in children[:beam_width]]
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    value, path, partitions = best
+    if partitions is None:
+        partitions = quantify_disparity.workers
+        for attribute in path:
+            partitions = quantify_disparity.split(partitions, attribute)
+    tree = quantify_disparity.partition_tree(partitions, [list(path)] * len(partitions))
+    tree.trace = budget.trace
+    return tree
+
+
+def _evaluate_in_process(quantify_disparity, candidates, budget, best):
+    evaluated = []
+    for path, partitions, parent_value in candidates:
+        if (best or evaluated) and budget.exhausted:
+            break
+        children = quantify_disparity.split(partitions, path[-1])
+        evaluated.append((path, children, quantify_disparity.metric(children), parent_value))
+        budget.spend()
+    return evaluated
+
+
+def _evaluate_in_pool(pool, candidates, budget, best, processes):
+    # candidates are submitted a batch at a time, so that no more work is queued once the budget is exhausted
+    evaluated = []
+    start = 0
+    while start < len(candidates) and not ((best or evaluated) and budget.exhausted):
+        size = processes
+        if budget.max_evaluations is not None:
+            size = max(1, min(size, budget.max_evaluations - budget.evaluations))
+        batch = candidates[start:start + size]
+        start += size
+        values = pool.map(_evaluate, [path for path, _, _ in batch])
+        for (path, _, parent_value), value in zip(batch, values):
+            evaluated.append((path, None, value, parent_value))
+        budget.spend(len(batch))
+    return evaluated
@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+ATTRIBUTES = {
+    'Gender': ['Male', 'Female'],
+    'Country': ['America', 'India', 'Other'],
+    'Language': ['English', 'Hindi', 'Other'],
+    'Ethnicity': ['White', 'Indian', 'Other']
+}
+
+
+def simulated_workers(n, seed=0):
+    """
+    Builds n workers with random attribute values and qualifications, like the simulated dataset of
+    common/add_100k_workers.py.
+    :return: tuple of (list of workers dicts, dict of attributes and their values)
+    """
+    rng = random.Random(seed)
+    workers = []
+    for i in range(n):
+        worker = {'id': i, 'LanguageTest': rng.randint(0, 100), 'ApprovalRate': rng.randint(0, 100)}
+        for attribute, values in ATTRIBUTES.items():
+            worker[attribute] = rng.choice(values)
+        workers.append(worker)
+    return workers, {attribute: list(values) for attribute, values in ATTRIBUTES.items()}
+
+
+@pytest.fixture
+def workers():
+    return simulated_workers(120)
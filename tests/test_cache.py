@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from conftest import simulated_workers
+from disparity.cache import EMDCache
+from disparity.emd import EMD
+from disparity.montecarlo import MonteCarlo
+
+
+def keys(n):
+    return [EMDCache.key([i], [i + 1], 'auto', True) for i in range(n)]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    path = str(tmp_path / 'emd.sqlite')
+    cache = EMDCache(path, max_entries=3, flush_every=1)
+    k = keys(4)
+    for i in range(3):
+        cache.set(k[i], float(i))
+        time.sleep(0.01)
+    # reading k0 makes k1 the least recently used entry
+    assert cache.get(k[0]) == 0.0
+    cache.flush()
+    time.sleep(0.01)
+    cache.set(k[3], 3.0)
+    assert cache.stats()['entries'] == 3
+
+    reopened = EMDCache(path)
+    assert [reopened.get(key) for key in k] == [0.0, None, 2.0, 3.0]
+
+
+def test_counters_survive_flushes(tmp_path):
+    path = str(tmp_path / 'emd.sqlite')
+    cache = EMDCache(path)
+    key = keys(1)[0]
+    assert cache.get(key) is None
+    cache.set(key, 1.0)
+    assert cache.get(key) == 1.0
+    cache.flush()
+    cache.flush()
+    assert cache.get(key) == 1.0
+
+    other = EMDCache(path)
+    assert other.get(key) == 1.0
+    assert other.get(keys(2)[1]) is None
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+    assert (stats['total_hits'], stats['total_misses']) == (2, 1)
+    stats = other.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+    assert (stats['total_hits'], stats['total_misses']) == (3, 2)
+    assert stats['total_hit_rate'] == pytest.approx(3 / 5)
+
+
+def test_values_of_pool_workers_reach_the_parent(workers, tmp_path):
+    workers, attributes = workers
+    path = str(tmp_path / 'emd.sqlite')
+    parallel = MonteCarlo(EMD(workers, attributes, f=[0.3, 0.7], cache=path, verbose=False))
+    values = parallel.run('unbalanced', 40, seed=5, processes=4)
+    assert EMDCache(path).stats()['entries'] > 0
+
+    # the same runs in the parent find every EMD computed by the pool workers
+    cache = EMDCache(path)
+    serial = MonteCarlo(EMD(workers, attributes, f=[0.3, 0.7], cache=cache, verbose=False))
+    assert serial.run('unbalanced', 40, seed=5) == pytest.approx(values, rel=1e-12)
+    stats = cache.stats()
+    assert stats['hits'] > 0 and stats['misses'] == 0
+
+
+@pytest.fixture(scope='module')
+def many_workers():
+    # auto bins need partitions large enough for numpy to decide on their bins
+    workers, attributes = simulated_workers(600)
+    return workers, {attribute: attributes[attribute] for attribute in ['Gender', 'Country', 'Language']}
+
+
+@pytest.mark.parametrize('bins', ['preset', 'auto'])
+@pytest.mark.parametrize('normalize', [True, False])
+def test_cache_does_not_change_the_values(many_workers, tmp_path, normalize, bins):
+    workers, attributes = many_workers
+    cache = EMDCache(str(tmp_path / 'emd.sqlite'))
+    expected = EMD(workers, attributes, f=[0.3, 0.7], normalize=normalize, bins=bins, verbose=False).exhaustive()
+    for _ in range(2):
+        # computed the first time, read from the cache the second time
+        quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], normalize=normalize, bins=bins, cache=cache,
+                                 verbose=False)
+        tree = quantify_disparity.exhaustive()
+        # normalized EMDs are cached under symmetric keys, EMD(q, p) is then read for EMD(p, q), which pyemd may
+        # round differently in the last bit
+        tolerance = 1e-12 if normalize else 0
+        assert tree.value == pytest.approx(expected.value, rel=tolerance, abs=0)
+        assert [leaf.contribution for leaf in tree.leaves] == \
+            pytest.approx([leaf.contribution for leaf in expected.leaves], rel=tolerance, abs=0)
+    assert cache.stats()['hits'] > 0
@@ -0,0 +1,64 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+# Modules that must not be loaded until an engine or data source actually needs them.
+BACKENDS = ['pyemd', 'pymongo', 'beautifultable', 'pandas', 'seaborn', 'matplotlib', 'sklearn', 'scipy']
+HEAVY_MODULES = BACKENDS + ['numpy']
+
+# The entry point and the data helpers are imported by every CLI call, including `--help`.
+FRONTEND_MODULES = ['disparity', 'disparity.cli', 'disparity.helpers']
+# The engines compute with numpy, but must not load any other backend before it is used.
+ENGINE_MODULES = ['disparity.disparity', 'disparity.partition', 'disparity.emd', 'disparity.divergence',
+                  'disparity.search', 'disparity.montecarlo', 'disparity.ranking', 'disparity.cache']
+
+# Import time depends on the machine, the bounds only catch gross regressions (e.g. a backend imported through another
+# path). They can be changed, or disabled with 0, through the environment.
+FRONTEND_SECONDS = float(os.environ.get('DISPARITY_FRONTEND_IMPORT_SECONDS', 5))
+ENGINE_SECONDS = float(os.environ.get('DISPARITY_ENGINE_IMPORT_SECONDS', 20))
+
+
+def measure_import_time(module, python=sys.executable):
+    """
+    Measures the time it takes a fresh interpreter to import a module, using `python -X importtime`.
+    :param module: string, dotted name of the module to import.
+    :param python: string, path of the interpreter to use.
+    :return: tuple of (cumulative import time of the module in seconds, set of all the imported module names)
+    """
+    result = subprocess.run([python, '-X', 'importtime', '-c', 'import ' + module],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        match = re.match(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(.*)$', line)
+        if match:
+            cumulative[match.group(3).strip()] = int(match.group(2)) / 1e6
+    return cumulative.get(module, 0.0), set(cumulative)
+
+
+def eager(imported, heavy):
+    return sorted(m for m in imported if m.split('.')[0] in heavy)
+
+
+@pytest.mark.parametrize('module', FRONTEND_MODULES)
+def test_frontend_imports_no_heavy_module(module):
+    seconds, imported = measure_import_time(module)
+    assert eager(imported, HEAVY_MODULES) == []
+    assert not FRONTEND_SECONDS or seconds < FRONTEND_SECONDS
+
+
+@pytest.mark.parametrize('module', ENGINE_MODULES)
+def test_engine_imports_no_backend(module):
+    seconds, imported = measure_import_time(module)
+    assert eager(imported, BACKENDS) == []
+    assert not ENGINE_SECONDS or seconds < ENGINE_SECONDS
+
+
+@pytest.mark.parametrize('module', ['disparity.disparity', 'disparity.emd', 'disparity.divergence'])
+def test_metrics_import_no_process_pool(module):
+    # pool workers import the metrics, only the searches that spread work over processes need multiprocessing
+    _, imported = measure_import_time(module)
+    assert eager(imported, ['multiprocessing', 'logging']) == []
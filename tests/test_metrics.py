@@ -0,0 +1,72 @@
+import math
+import random
+
+import pytest
+
+from disparity.disparity import QuantifyingDisparity
+from disparity.divergence import KL, METRICS, multi_metric
+from disparity.emd import EMD
+
+
+def test_histograms_of_foreign_partitions_are_not_cached(workers):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+    rng = random.Random(1)
+    for _ in range(300):
+        # fresh copies, freed after every iteration so that their ids are reused
+        copies = [dict(worker, Accepted=rng.random()) for worker in workers]
+        partitions = quantify_disparity.split([copies], 'Gender')
+        clean = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+        assert quantify_disparity.metric(partitions) == clean.metric(partitions)
+    assert len(quantify_disparity._histograms) == 0
+
+
+def test_histograms_of_own_partitions_are_cached(workers):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+    partitions = quantify_disparity.split(quantify_disparity.workers, 'Gender')
+    first = quantify_disparity.metric(partitions)
+    assert len(quantify_disparity._histograms) == len(partitions)
+    assert quantify_disparity.metric(quantify_disparity.split(quantify_disparity.workers, 'Gender')) == first
+    assert len(quantify_disparity._histograms) == len(partitions)
+
+
+@pytest.mark.parametrize('criterion', ['avg', 'max', 'min'])
+@pytest.mark.parametrize('name', list(METRICS))
+def test_multi_metric_matches_the_metric_classes(workers, name, criterion):
+    workers, attributes = workers
+    quantify_disparity = METRICS[name](workers, attributes, f=[0.3, 0.7], criterion=criterion, verbose=False)
+    tree = quantify_disparity.exhaustive()
+    values = multi_metric(quantify_disparity, tree)
+    for other, metric_class in METRICS.items():
+        expected = metric_class(workers, attributes, f=[0.3, 0.7], criterion=criterion, verbose=False).metric(tree)
+        assert values[other] == expected
+
+
+def test_kl_is_finite_with_smoothing(workers):
+    workers, attributes = workers
+    raw = KL(workers, attributes, f=[0.3, 0.7], scaling='none', smoothing=0, verbose=False)
+    partitions = raw.exhaustive().partitions()
+    assert math.isinf(raw.metric(partitions))
+    smoothed = KL(workers, attributes, f=[0.3, 0.7], verbose=False)
+    assert math.isfinite(smoothed.metric(partitions))
+
+
+def test_multi_metric_builds_histograms_once_per_scaling(workers, monkeypatch):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+    partitions = quantify_disparity.split(quantify_disparity.workers, 'Country')
+
+    counted = []
+    values = QuantifyingDisparity.values
+
+    def spy(partition):
+        # the values of all the workers are also read to scale them and to place the bins
+        if len(partition) < len(workers):
+            counted.append(len(partition))
+        return values(partition)
+
+    monkeypatch.setattr(QuantifyingDisparity, 'values', staticmethod(spy))
+    multi_metric(quantify_disparity, partitions)
+    # EMD, JS and TV bin the raw values, KL the standardized ones
+    assert len(counted) == 2 * len(partitions)
@@ -0,0 +1,71 @@
+import random
+
+import numpy as np
+import pytest
+
+from disparity import cli
+from disparity.emd import EMD
+from disparity.montecarlo import MonteCarlo
+
+
+class RecordingGenerator:
+    """
+    Draws from a numpy Generator and records the index of every attribute drawn, so that a run can be replayed.
+    """
+
+    def __init__(self, stream):
+        self.rng = np.random.default_rng(stream)
+        self.draws = []
+
+    def integers(self, n):
+        index = self.rng.integers(n)
+        self.draws.append(int(index))
+        return index
+
+
+@pytest.mark.parametrize('criterion', ['avg', 'max', 'min'])
+@pytest.mark.parametrize('variant', ['balanced', 'unbalanced'])
+def test_runs_match_the_random_algorithms(workers, monkeypatch, variant, criterion):
+    workers, attributes = workers
+    attributes = {attribute: attributes[attribute] for attribute in ['Gender', 'Country', 'Language']}
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], criterion=criterion, verbose=False)
+    engine = MonteCarlo(quantify_disparity)
+    run = engine.balanced_run if variant == 'balanced' else engine.unbalanced_run
+    method = quantify_disparity.random_balanced if variant == 'balanced' else quantify_disparity.random_unbalanced
+
+    for stream in np.random.SeedSequence(7).spawn(10):
+        rng = RecordingGenerator(stream)
+        value = run(rng)
+        # the random algorithms draw from the remaining attributes, in the same order as the engine
+        draws = iter(rng.draws)
+        monkeypatch.setattr(random, 'choice', lambda attributes: attributes[next(draws)])
+        tree = method()
+        assert next(draws, None) is None
+        assert value == pytest.approx(quantify_disparity.metric(tree.partitions()), rel=1e-12)
+
+
+@pytest.mark.parametrize('variant', ['balanced', 'unbalanced'])
+def test_processes_do_not_change_the_values(workers, variant):
+    workers, attributes = workers
+    attributes = {attribute: attributes[attribute] for attribute in ['Gender', 'Country', 'Language']}
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+    serial = MonteCarlo(quantify_disparity).run(variant, 50, seed=3)
+    parallel = MonteCarlo(quantify_disparity).run(variant, 50, seed=3, processes=2)
+    # every process numbers the groups it meets, so averages may sum the same distances in another order
+    assert parallel == pytest.approx(serial, rel=1e-12)
+    assert len(serial) == 50
+
+
+def test_runs_must_be_positive(workers):
+    workers, attributes = workers
+    engine = MonteCarlo(EMD(workers, attributes, f=[0.3, 0.7], verbose=False))
+    with pytest.raises(AssertionError):
+        engine.run('balanced', 0)
+
+
+@pytest.mark.parametrize('runs', ['0', '-5'])
+def test_cli_rejects_non_positive_random_runs(runs, monkeypatch):
+    monkeypatch.setattr(cli, 'run', lambda *args: pytest.fail('the experiment should not run'))
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['--random-runs', runs])
+    assert exit_info.value.code == 2
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from disparity.divergence import KL
+from disparity.emd import EMD
+from disparity.partition import PartitionTree
+
+ALGORITHMS = ['balanced', 'unbalanced', 'exhaustive']
+
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+@pytest.mark.parametrize('criterion', ['avg', 'max', 'min'])
+def test_tree_value_is_the_metric_of_its_partitions(workers, criterion, algorithm):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], criterion=criterion, verbose=False)
+    tree = getattr(quantify_disparity, algorithm)()
+    assert tree.quantified_by(quantify_disparity)
+    # the value aggregates the contributions of the leaves, avg sums the same distances in another order
+    assert tree.value == pytest.approx(quantify_disparity.metric(tree.partitions()), rel=1e-12)
+    assert quantify_disparity.metric(tree) == tree.value
+
+
+def test_metric_recomputes_trees_of_other_settings(workers):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], criterion='avg', verbose=False)
+    tree = quantify_disparity.exhaustive()
+
+    # same workers, another criterion
+    maximum = EMD(workers, attributes, f=[0.3, 0.7], criterion='max', verbose=False)
+    assert not tree.quantified_by(maximum)
+    assert maximum.metric(tree) == maximum.metric(tree.partitions()) != tree.value
+
+    # same settings, but other workers
+    other = EMD(workers, attributes, f=[0.3, 0.7], criterion='avg', verbose=False)
+    assert not tree.quantified_by(other)
+    assert other.metric(tree) == pytest.approx(tree.value)
+
+    # another metric sharing the workers
+    kl = quantify_disparity.copy_as(KL)
+    assert not tree.quantified_by(kl)
+    assert kl.metric(tree) == kl.metric(tree.partitions()) != tree.value
+
+
+def test_to_dict_is_json_serializable(workers):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+    tree = quantify_disparity.unbalanced()
+    serialized = json.loads(json.dumps(tree.to_dict()))
+    assert serialized['value'] == tree.value
+    assert serialized['settings'][0] == 'EMD'
+    assert serialized['root']['size'] == len(workers)
+    assert sum(leaf.size for leaf in tree.leaves) == len(workers)
+
+
+def test_signature_ignores_the_order_of_the_leaves(workers):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+    tree = quantify_disparity.exhaustive()
+    reordered = PartitionTree(tree._workers, list(reversed(tree.leaves)), tree.value, tree.settings)
+    assert reordered.signature() == tree.signature()
+    assert reordered == tree
+    assert [len(p) for p in reordered] == [len(p) for p in reversed(tree.partitions())]
+
+    coarser = quantify_disparity.split(quantify_disparity.workers, 'Gender')
+    assert quantify_disparity.partition_tree(coarser, [['Gender']] * len(coarser)) != tree
@@ -0,0 +1,80 @@
+import csv
+
+import pytest
+
+from conftest import simulated_workers
+from disparity.emd import EMD
+from disparity.ranking import RankingLog, audit, discount
+
+ROWS = [
+    ('plumber', '1|2|3'),
+    ('plumber', '2|1'),
+    ('designer', '3|4|5|6'),
+    ('translator', ''),
+    ('designer', '4'),
+    ('plumber', '3'),
+    ('writer', '7'),
+    ('translator', '8|9'),
+]
+
+
+def write_log(path, rows):
+    with open(path, mode='w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['query', 'workers'])
+        writer.writerows(rows)
+    return str(path)
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return write_log(tmp_path / 'rankings.csv', ROWS)
+
+
+def test_chunk_size_does_not_change_the_exposures(log_path):
+    expected = RankingLog(log_path, chunk_size=100).exposure_by_query()
+    assert sorted(expected) == ['designer', 'plumber', 'translator', 'writer']
+    for chunk_size in [1, 2]:
+        exposures = RankingLog(log_path, chunk_size=chunk_size).exposure_by_query()
+        assert sorted(exposures) == sorted(expected)
+        for query in expected:
+            assert exposures[query] == pytest.approx(expected[query])
+
+
+def test_exposures_are_averaged_over_all_the_rows_of_a_query(log_path):
+    exposures = RankingLog(log_path, chunk_size=2).exposure_by_query(scheme='position')
+    # plumber was logged 3 times, rows in which a worker was not ranked count as 0
+    assert exposures['plumber'] == pytest.approx({'1': (1 + 1 / 2) / 3, '2': (1 / 2 + 1) / 3, '3': (1 / 3 + 1) / 3})
+    assert exposures['designer'] == pytest.approx({'3': 1 / 2, '4': (1 / 2 + 1) / 2, '5': 1 / 3 / 2, '6': 1 / 4 / 2})
+
+
+def test_a_worker_ranked_once_in_a_hundred_rows(tmp_path):
+    rows = [('plumber', '1')] + [('plumber', '2|3')] * 99
+    exposures = RankingLog(write_log(tmp_path / 'rankings.csv', rows), chunk_size=7).exposure_by_query()
+    assert exposures['plumber']['1'] == pytest.approx(1 / 100)
+    assert exposures['plumber']['2'] == pytest.approx(99 / 100)
+    assert exposures['plumber']['3'] == pytest.approx(99 * discount([2])[0] / 100)
+
+
+def test_empty_rankings_count_as_rows(log_path):
+    log = RankingLog(log_path, chunk_size=3)
+    rankings = [ranking for _, chunk in log.chunks() for ranking in chunk]
+    assert rankings[3] == []
+    # the empty row of translator halves the exposure of its workers
+    assert log.exposure_by_query()['translator'] == pytest.approx({'8': 1 / 2, '9': discount([2])[0] / 2})
+    assert sum(len(workers) for _, workers, _ in log.scores()) == sum(len(r.split('|')) for _, r in ROWS if r)
+
+
+def test_audit_skips_queries_below_min_workers(tmp_path):
+    workers, attributes = simulated_workers(120)
+    rows = [('plumber', '|'.join(str(i) for i in range(60))),
+            ('designer', '|'.join(str(i) for i in range(60, 120))),
+            ('writer', '7')]
+    log = RankingLog(write_log(tmp_path / 'rankings.csv', rows))
+    values = audit(EMD, log, workers, attributes, min_workers=2)
+    assert sorted(values) == ['designer', 'plumber']
+
+    ranked = log.accepted_by_query(workers)['plumber']
+    expected = EMD(ranked, attributes, configuration='ranking', verbose=False)
+    assert values['plumber'] == expected.metric(expected.balanced())
+    assert sorted(audit(EMD, log, workers, attributes, min_workers=61)) == []
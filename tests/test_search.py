@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import simulated_workers
+from disparity.emd import EMD
+
+
+@pytest.fixture(scope='module')
+def many_workers():
+    # auto bins need partitions large enough for numpy to decide on their bins
+    workers, attributes = simulated_workers(600)
+    return workers, {attribute: attributes[attribute] for attribute in ['Gender', 'Country', 'Language']}
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+@pytest.mark.parametrize('bins', ['preset', 'auto'])
+@pytest.mark.parametrize('criterion', ['avg', 'max', 'min'])
+def test_greedy_anytime_is_balanced(request, criterion, bins, processes):
+    workers, attributes = request.getfixturevalue('many_workers' if bins == 'auto' else 'workers')
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], bins=bins, criterion=criterion, verbose=False)
+    balanced = quantify_disparity.balanced()
+    anytime = quantify_disparity.anytime(processes=processes)
+    assert anytime == balanced
+    assert anytime.value == balanced.value
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_max_evaluations_stops_the_search(workers, processes):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+    unbounded = quantify_disparity.anytime(beam_width=2, processes=processes)
+    assert unbounded.trace[-1][1] > 3
+
+    tree = quantify_disparity.anytime(beam_width=2, max_evaluations=3, processes=processes)
+    assert all(evaluations <= 3 for _, evaluations, _ in tree.trace)
+    # the first level is evaluated until the budget runs out, nothing is split further
+    assert {len(leaf.label) for leaf in tree.leaves} == {1}
+
+
+def test_trace_records_every_improvement(workers):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+    tree = quantify_disparity.anytime(beam_width=3)
+    elapsed, evaluations, values = zip(*tree.trace)
+    assert list(elapsed) == sorted(elapsed)
+    assert list(evaluations) == sorted(evaluations)
+    assert all(previous < value for previous, value in zip(values, values[1:]))
+    assert values[-1] == pytest.approx(tree.value)
+    # the best partitioning of the beam is at least as unfair as the greedy one
+    assert tree.value >= quantify_disparity.balanced().value
+
+
+def test_unbalanced_without_evaluations_returns_the_first_split(workers):
+    workers, attributes = workers
+    quantify_disparity = EMD(workers, attributes, f=[0.3, 0.7], verbose=False)
+    tree = quantify_disparity.unbalanced(max_evaluations=0)
+    attribute = quantify_disparity.balanced().leaves[0].label[0][0]
+    first_split = quantify_disparity.split(quantify_disparity.workers, attribute)
+    assert tree == quantify_disparity.partition_tree(first_split, [[attribute]] * len(first_split))
+    assert len(quantify_disparity.unbalanced()) > len(tree)